@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark clean_tag against the original implementation on a synthetic corpus of messy
+Spotify titles, including adversarial ones (long runs of " - " segments full of junk words).
+Both cleaners must agree on every string before any timing is reported.
+
+    python benchmarks/bench_clean_tag.py --size 50000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import spotty_tube  # noqa: E402
+
+# ---- The cleaner as it was before the precompiled, linear-time rewrite ----
+
+def legacy_drop_junk_brackets(s: str) -> str:
+    def repl(m):
+        inside = (m.group(1) or m.group(2) or "").lower()
+        return "" if any(w in inside for w in spotty_tube.BAD_WORDS) else m.group(0)
+    pat = re.compile(r"\(([^)]*)\)|\[([^\]]*)\]")
+    prev = None
+    cur = s
+    while prev != cur:
+        prev = cur
+        cur = pat.sub(repl, cur)
+    return cur
+
+def legacy_drop_junk_suffix(s: str) -> str:
+    while True:
+        m = re.search(r"[\s\-\/]+([^\/\-]+)$", s)
+        if not m:
+            return s
+        tail = m.group(1).strip().lower()
+        if any(w in tail for w in spotty_tube.BAD_WORDS):
+            s = s[:m.start()].rstrip()
+        else:
+            return s
+
+def legacy_clean_tag(s: str) -> str:
+    return spotty_tube.squash_spaces(legacy_drop_junk_suffix(legacy_drop_junk_brackets(s))).strip()
+
+# ---- Corpus ----
+
+WORDS = ["love", "night", "city", "heart", "fire", "blue", "dream", "road", "home", "light", "rain", "gold"]
+JUNK = ["Remastered 2011", "Deluxe Edition", "Live", "Mono Version", "feat. Someone", "Bonus Track",
+        "Radio Edit", "Instrumental", "2009 Remaster", "Expanded Edition", "Acoustic", "Re-Recorded"]
+ARTISTS = [f"The {w.title()} {x}" for w in WORDS for x in ("Band", "Kids", "Collective")]
+
+def make_corpus(size: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(size):
+        kind = i % 10
+        title = " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(1, 4)))
+        if kind < 3:
+            out.append(rnd.choice(ARTISTS))  # artist strings repeat a lot
+        elif kind < 5:
+            out.append(f"{title} - {rnd.choice(JUNK)}")
+        elif kind < 7:
+            out.append(f"{title} ({rnd.choice(JUNK)}) [{rnd.choice(JUNK)}]")
+        elif kind < 9:
+            out.append(title)
+        else:
+            # adversarial: many dash-separated junk segments
+            segs = [rnd.choice(JUNK) for _ in range(rnd.randint(50, 200))]
+            out.append(title + " - " + " - ".join(segs))
+    return out
+
+def timeit(fn: Callable[[str], str], corpus: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for s in corpus:
+            fn(s)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description="clean_tag benchmark: legacy vs current")
+    ap.add_argument("--size", type=int, default=20_000, help="Number of synthetic titles")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported)")
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.size, args.seed)
+    uncached = spotty_tube.clean_tag.__wrapped__
+
+    mismatches = [s for s in corpus if legacy_clean_tag(s) != uncached(s)]
+    if mismatches:
+        print(f"{len(mismatches)} outputs differ from the legacy cleaner, e.g. {mismatches[0]!r}")
+        sys.exit(1)
+
+    legacy = timeit(legacy_clean_tag, corpus, args.repeat)
+    current = timeit(uncached, corpus, args.repeat)
+    spotty_tube.clean_tag.cache_clear()
+    cold = timeit(spotty_tube.clean_tag, corpus, 1)
+    warm = timeit(spotty_tube.clean_tag, corpus, args.repeat)
+
+    n = len(corpus)
+    print(f"corpus: {n} titles, {sum(map(len, corpus))} chars; outputs identical")
+    print(f"legacy:            {legacy:8.3f}s  {1e6 * legacy / n:8.1f} µs/title")
+    print(f"current:           {current:8.3f}s  {1e6 * current / n:8.1f} µs/title  ({legacy / current:.1f}x)")
+    print(f"memoized, cold:    {cold:8.3f}s  {1e6 * cold / n:8.1f} µs/title  ({legacy / cold:.1f}x)")
+    print(f"memoized, warm:    {warm:8.3f}s  {1e6 * warm / n:8.1f} µs/title  ({legacy / warm:.1f}x)")
+
+if __name__ == "__main__":
+    main()
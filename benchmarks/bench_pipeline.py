@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro and macro benchmarks for the Spotify → YouTube resolution pipeline, run against the
+synthetic catalogue in benchmarks/synthetic.py (no network, no real quota).
+
+For each playlist size it reports, per stage and end to end: wall time, tracks per second,
+API calls and quota units per track, quota units per correctly matched track, peak RSS, and
+how often the resolver picked the ground-truth video. Each size runs in its own subprocess.
+On Linux the kernel's peak-RSS mark is reset before each stage, so peak RSS is the stage's own;
+elsewhere it is the peak since the scenario started (marked "*" in the table). "+MB" is how far
+the stage's peak rose above the RSS it started with.
+Results are written as JSON; --compare prints the change against an earlier result file.
+
+    python benchmarks/bench_pipeline.py --sizes 100,1000,10000 --jobs 8
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/<old>.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import spotty_tube as st  # noqa: E402
+from synthetic import FakeSpotify, FakeYouTube, World, ground_truth  # noqa: E402
+
+PLAYLIST = "37i9dQZF1DXcBWIGoYBM5M"
+
+def reset_peak_rss() -> bool:
+    """Reset the process's peak RSS (VmHWM) to its current RSS; Linux only. False if not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def proc_status_mb(field: str) -> Optional[float]:
+    """A kB field of /proc/self/status (VmRSS, VmHWM) in MB; None where there is no /proc."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset_peak_rss(), or since the process started if it can't be reset."""
+    peak_mb = proc_status_mb("VmHWM")
+    if peak_mb is not None:
+        return peak_mb
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class Stages:
+    def __init__(self, world: World):
+        self.world = world
+        self.results: Dict[str, dict] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, n_tracks: int):
+        self.world.reset_counters()
+        per_stage = reset_peak_rss()
+        start_mb = proc_status_mb("VmRSS")
+        t0 = time.perf_counter()
+        yield
+        secs = time.perf_counter() - t0
+        calls = sum(c for m, c in self.world.calls.items() if not m.startswith("spotify."))
+        n = max(1, n_tracks)
+        peak_mb = peak_rss_mb()
+        self.results[name] = {
+            "seconds": round(secs, 4),
+            "tracks_per_sec": round(n_tracks / secs, 1) if secs else None,
+            "api_calls": dict(self.world.calls),
+            "yt_calls_per_track": round(calls / n, 3),
+            "quota_units_per_track": round(self.world.units / n, 2),
+            "peak_rss_mb": round(peak_mb, 1),
+            "peak_rss_per_stage": per_stage,
+            "peak_rss_growth_mb": round(peak_mb - start_mb, 1) if per_stage and start_mb is not None else None,
+        }
+
+    def matched(self, name: str, picks: Dict[tuple, str], truth: Dict[tuple, str]) -> None:
+        """Record the quota units the stage spent per correctly matched track (right after the stage)."""
+        correct = sum(1 for k, v in picks.items() if v and truth.get(k) == v)
+        self.results[name]["quota_units_per_match"] = round(self.world.units / correct, 1) if correct else None
+
+def accuracy(picks: Dict[tuple, str], truth: Dict[tuple, str]) -> float:
+    scored = [k for k in picks if truth.get(k)]
+    return round(sum(picks[k] == truth[k] for k in scored) / len(scored), 4) if scored else 0.0
+
+def run_main(world: World, argv: List[str]) -> None:
+    """Run spotty_tube.main() end to end with the synthetic clients plugged in."""
+    saved = st.spotify_client, st.youtube_credentials, st.youtube_service
+    st.spotify_client = lambda *a, **k: FakeSpotify(world)
+    st.youtube_credentials = lambda **k: None
+    st.youtube_service = lambda *a, **k: FakeYouTube(world)
+    old_argv = sys.argv
+    sys.argv = ["spotty_tube.py"] + argv
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            st.main()
+    finally:
+        sys.argv = old_argv
+        st.spotify_client, st.youtube_credentials, st.youtube_service = saved
+
+def run_scenario(size: int, jobs: int, latency: float, seed: int) -> dict:
+    world = World(size, seed=seed, latency=latency)
+    truth = ground_truth(world)
+    stages = Stages(world)
+
+    def new_client() -> st.YouTubeClient:
+        # No ledger, limiter or pool: the stages count calls and units on the synthetic world
+        return st.YouTubeClient(FakeYouTube(world))
+
+    yt = new_client()
+
+    # Micro: clean_tag on every raw artist and title, uncached
+    raw = [t["name"] for t in world.tracks] + [", ".join(a["name"] for a in t["artists"]) for t in world.tracks]
+    t0 = time.perf_counter()
+    for s in raw:
+        st.clean_tag.__wrapped__(s)
+    clean_us = 1e6 * (time.perf_counter() - t0) / len(raw)
+    st.clean_tag.cache_clear()
+
+    with stages.stage("spotify_fetch", size):
+        albums: Dict[tuple, str] = {}
+        tracks = st.fetch_playlist_tracks(FakeSpotify(world), PLAYLIST, albums=albums)
+    n = len(tracks)
+
+    # Micro: scoring one track's candidates, details already fetched
+    sample = tracks[: min(200, n)]
+    batch = []
+    for artist, title, secs in sample:
+        ids = [it["id"]["videoId"] for it in world.search(q=f"{artist} - {title}", maxResults=8)["items"]]
+        details = st.fetch_video_details(yt, ids)
+        batch.append(([details.get(v) for v in ids], artist, title, secs))
+    for entry in batch:
+        st.score_candidates(*entry)  # warm the token caches
+    t0 = time.perf_counter()
+    for entry in batch:
+        st.score_candidates(*entry)
+    score_us = 1e6 * (time.perf_counter() - t0) / max(1, len(batch))
+
+    lookup = st.DetailsBatcher(workers=jobs) if jobs > 1 else None
+    # Up to two searches per track: more matches, but at what cost per match
+    with stages.stage("resolve_two_searches", n):
+        double = dict(st.resolve_tracks(yt, tracks, 8, jobs=jobs, new_client=new_client,
+                                        lookup=lookup, planner=st.QueryPlanner(max_searches=2)))
+    stages.matched("resolve_two_searches", double, truth)
+    planner = st.QueryPlanner()
+    with stages.stage("resolve", n):
+        picks = dict(st.resolve_tracks(yt, tracks, 8, jobs=jobs, new_client=new_client, lookup=lookup,
+                                       planner=planner))
+    stages.matched("resolve", picks, truth)
+    vids = list(picks.values())
+
+    # Same tracks, matched against the artists' Topic channel uploads first
+    topic = st.TopicChannelIndex(":memory:", lookup=lookup)
+    topic.expect(tracks)
+    with stages.stage("resolve_topic", n):
+        topic_picks = dict(st.resolve_tracks(yt, tracks, 8, jobs=jobs, new_client=new_client,
+                                             lookup=lookup, resolvers=[topic]))
+    stages.matched("resolve_topic", topic_picks, truth)
+    topic.close()
+
+    # ... and against the auto-generated album playlists only
+    album_index = st.AlbumPlaylistIndex(":memory:", albums, lookup=lookup)
+    album_index.expect(tracks)
+    with stages.stage("resolve_album", n):
+        album_picks = dict(st.resolve_tracks(yt, tracks, 8, jobs=jobs, new_client=new_client,
+                                             lookup=lookup, resolvers=[album_index]))
+    stages.matched("resolve_album", album_picks, truth)
+    album_index.close()
+
+    # ... and from wide per-artist searches only
+    artist_index = st.ArtistSearchIndex(":memory:", lookup=lookup)
+    artist_index.expect(tracks)
+    with stages.stage("resolve_artist", n):
+        artist_picks = dict(st.resolve_tracks(yt, tracks, 8, jobs=jobs, new_client=new_client,
+                                              lookup=lookup, resolvers=[artist_index]))
+    stages.matched("resolve_artist", artist_picks, truth)
+    artist_index.close()
+
+    with stages.stage("playlist_insert", n):
+        pid = st.ensure_playlist(yt, "bench")
+        for vid in dict.fromkeys(v for v in vids if v):
+            st.add_to_playlist(yt, pid, vid)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        argv = ["--spotify-playlist", PLAYLIST, "--yt-title", "bench-e2e", "--client-id", "x",
+                "--jobs", str(jobs), "--quota-limit", str(10**9), "--yt-rate", "0", "--cache-db", os.path.join(tmp, "cache.sqlite"),
+                "--urls-out", os.path.join(tmp, "urls.txt"), "--yt-client-json", os.path.join(tmp, "none.json")]
+        with stages.stage("end_to_end_cold", n):
+            run_main(world, argv)
+        with stages.stage("end_to_end_warm", n):
+            run_main(world, argv)
+        # Cold again, but resolving while the Spotify pages are still coming in
+        argv[argv.index("--cache-db") + 1] = os.path.join(tmp, "stream.sqlite")
+        argv[argv.index("--yt-title") + 1] = "bench-stream"
+        with stages.stage("end_to_end_stream", n):
+            run_main(world, argv + ["--stream"])
+
+    return {
+        "size": size,
+        "tracks": n,
+        "jobs": jobs,
+        "latency_ms": latency * 1000,
+        "clean_tag_us": round(clean_us, 2),
+        "score_candidates_us": round(score_us, 2),
+        "accuracy": accuracy(picks, truth),
+        "accuracy_two_searches": accuracy(double, truth),
+        "strategies": {f"{name}/{pos}": {"tries": t, "wins": w} for (name, pos), (t, w) in planner.counts.items()},
+        "accuracy_topic": accuracy(topic_picks, truth),
+        "accuracy_album": accuracy(album_picks, truth),
+        "accuracy_artist": accuracy(artist_picks, truth),
+        "stages": stages.results,
+    }
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_table(results: List[dict]) -> None:
+    for r in results:
+        print(f"\n== {r['tracks']} tracks (jobs={r['jobs']}, latency={r['latency_ms']:g} ms) "
+              f"accuracy={r['accuracy']:.1%} (two searches {r.get('accuracy_two_searches', 0):.1%}, topic {r.get('accuracy_topic', 0):.1%}, album {r.get('accuracy_album', 0):.1%}, "
+              f"artist {r.get('accuracy_artist', 0):.1%}) "
+              f"clean_tag={r['clean_tag_us']} µs score={r['score_candidates_us']} µs")
+        print(f"{'stage':<21}{'seconds':>10}{'tracks/s':>12}{'calls/trk':>11}{'units/trk':>11}{'units/match':>13}"
+              f"{'peak MB':>10}{'+MB':>8}")
+        for name, s in r["stages"].items():
+            per_match = s.get("quota_units_per_match")
+            print(f"{name:<21}{s['seconds']:>10.3f}{s['tracks_per_sec'] or 0:>12.1f}"
+                  f"{s['yt_calls_per_track']:>11.3f}{s['quota_units_per_track']:>11.2f}"
+                  f"{per_match if per_match is not None else '-':>13}{s['peak_rss_mb']:>10.1f}"
+                  f"{'' if s.get('peak_rss_per_stage') else '*'}"
+                  f"{s['peak_rss_growth_mb'] if s.get('peak_rss_growth_mb') is not None else '-':>8}")
+
+def print_comparison(old: dict, new: dict) -> None:
+    print(f"\n== {new['rev']} vs {old['rev']} (time ratio < 1 is faster)")
+    prev = {r["size"]: r for r in old["results"]}
+    for r in new["results"]:
+        o = prev.get(r["size"])
+        if not o:
+            continue
+        for name, s in r["stages"].items():
+            os_ = o["stages"].get(name)
+            if os_ and os_["seconds"]:
+                print(f"{r['tracks']:>6} {name:<21} time x{s['seconds'] / os_['seconds']:.2f}  "
+                      f"units/trk {os_['quota_units_per_track']} → {s['quota_units_per_track']}"
+                      + (f"  units/match {os_['quota_units_per_match']} → {s['quota_units_per_match']}"
+                         if os_.get("quota_units_per_match") and s.get("quota_units_per_match") else ""))
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the resolution pipeline on synthetic playlists")
+    ap.add_argument("--sizes", default="100,1000,10000", help="Comma-separated playlist sizes")
+    ap.add_argument("--jobs", type=int, default=1, help="--jobs passed to the resolver")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per API call")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="Result file (default: benchmarks/results/<git rev>-<timestamp>.json)")
+    ap.add_argument("--compare", help="Earlier result file to compare against")
+    ap.add_argument("--one", type=int, help=argparse.SUPPRESS)  # run a single size in this process
+    args = ap.parse_args()
+
+    if args.one:
+        json.dump(run_scenario(args.one, args.jobs, args.latency_ms / 1000, args.seed), sys.stdout)
+        return
+
+    results = []
+    for size in (int(x) for x in args.sizes.split(",") if x.strip()):
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--one", str(size), "--jobs", str(args.jobs),
+             "--latency-ms", str(args.latency_ms), "--seed", str(args.seed)],
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(proc.stdout))
+    report = {
+        "rev": git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    print_table(results)
+
+    out = args.out or os.path.join(HERE, "results", f"{report['rev']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
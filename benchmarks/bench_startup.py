@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup budget for spotty_tube.py, which runs many times an hour from cron. Every number is
+the median of several fresh interpreter processes:
+
+  import      `import spotty_tube`; none of the API client libraries may be loaded by it
+  help        `spotty_tube.py --help`, end to end
+  youtube     building the YouTube client from the cached, trimmed discovery document,
+              next to googleapiclient's build() from the full bundled one (needs googleapiclient)
+
+Exits non-zero when a budget is exceeded or a heavy library is imported eagerly.
+
+    python benchmarks/bench_startup.py --runs 9 --budget-import-ms 80
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "spotty_tube.py")
+HEAVY = ["spotipy", "requests", "googleapiclient", "google.auth", "google_auth_oauthlib", "httplib2"]
+
+IMPORT_SNIPPET = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import spotty_tube
+ms = 1000 * (time.perf_counter() - t0)
+print(json.dumps({{"ms": ms, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+YOUTUBE_SNIPPET = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import spotty_tube
+t0 = time.perf_counter()
+from googleapiclient.discovery import build
+import_ms = 1000 * (time.perf_counter() - t0)
+t0 = time.perf_counter()
+if {full!r}:
+    build("youtube", "v3", developerKey="x")
+else:
+    spotty_tube.youtube_service(api_endpoint="http://127.0.0.1:1/", cache_db={db!r})
+print(json.dumps({{"ms": 1000 * (time.perf_counter() - t0), "import_ms": import_ms}}))
+"""
+
+def run_json(code: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def median_ms(samples) -> float:
+    return round(statistics.median(samples), 1)
+
+def has_googleapiclient() -> bool:
+    return subprocess.run([sys.executable, "-c", "import googleapiclient.discovery"], capture_output=True).returncode == 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure spotty_tube.py startup against a time budget")
+    ap.add_argument("--runs", type=int, default=7, help="Fresh processes per measurement (median is reported)")
+    ap.add_argument("--budget-import-ms", type=float, default=100)
+    ap.add_argument("--budget-help-ms", type=float, default=250)
+    ap.add_argument("--budget-youtube-ms", type=float, default=150,
+                    help="Building the YouTube client from the cached discovery document")
+    args = ap.parse_args()
+
+    results = {}
+    failures = []
+
+    runs = [run_json(IMPORT_SNIPPET.format(root=ROOT, heavy=HEAVY)) for _ in range(args.runs)]
+    results["import"] = median_ms(r["ms"] for r in runs)
+    loaded = sorted({m for r in runs for m in r["loaded"]})
+    if loaded:
+        failures.append(f"import spotty_tube loads {', '.join(loaded)} eagerly")
+
+    samples = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT, "--help"], capture_output=True, check=True)
+        samples.append(1000 * (time.perf_counter() - t0))
+    results["help"] = median_ms(samples)
+
+    if has_googleapiclient():
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, "cache.sqlite")
+            cold = run_json(YOUTUBE_SNIPPET.format(root=ROOT, full=False, db=db))
+            warm = [run_json(YOUTUBE_SNIPPET.format(root=ROOT, full=False, db=db)) for _ in range(args.runs)]
+            full = [run_json(YOUTUBE_SNIPPET.format(root=ROOT, full=True, db=db)) for _ in range(args.runs)]
+        results["googleapiclient_import"] = median_ms(r["import_ms"] for r in warm)
+        results["youtube_cold"] = round(cold["ms"], 1)
+        results["youtube"] = median_ms(r["ms"] for r in warm)
+        results["youtube_full_build"] = median_ms(r["ms"] for r in full)
+    else:
+        print("googleapiclient not installed; skipping the YouTube client measurements")
+
+    budgets = {"import": args.budget_import_ms, "help": args.budget_help_ms, "youtube": args.budget_youtube_ms}
+    print(f"{'measurement':<24}{'ms':>10}{'budget':>10}")
+    for name, ms in results.items():
+        budget = budgets.get(name)
+        print(f"{name:<24}{ms:>10.1f}{budget if budget is not None else '':>10}")
+        if budget is not None and ms > budget:
+            failures.append(f"{name}: {ms:.1f} ms > {budget:g} ms")
+
+    for f in failures:
+        print(f"OVER BUDGET: {f}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
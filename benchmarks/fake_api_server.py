@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the parts of the Spotify Web API and YouTube Data API v3 that
+spotty_tube.py uses, serving the synthetic catalogue from benchmarks/synthetic.py.
+
+    python benchmarks/fake_api_server.py --tracks 2000 --latency-ms 80 --error-rate 0.02 --quota 10000
+    python spotty_tube.py --spotify-playlist 37i9dQZF1DXcBWIGoYBM5M --client-id x --yt-title Test \\
+        --spotify-api-base http://127.0.0.1:8765/v1/ --yt-api-endpoint http://127.0.0.1:8765/
+
+Spotify:  GET  /v1/playlists/<id>            (snapshot_id)
+          GET  /v1/playlists/<id>/tracks      (offset/limit paging)
+YouTube:  GET  /youtube/v3/search, /youtube/v3/videos, /youtube/v3/playlists, /youtube/v3/playlistItems
+          POST /youtube/v3/playlists, /youtube/v3/playlistItems
+Control:  GET  /_stats (calls and quota units per endpoint), POST /_reset
+
+Latency, random 5xx errors, rate limiting (429 + Retry-After for Spotify, 403 rateLimitExceeded
+for YouTube) and the YouTube daily quota (403 quotaExceeded once spent) are configurable.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import QUOTA_COSTS, World  # noqa: E402
+
+YT_ROUTES = {
+    ("GET", "search"): ("search.list", "search"),
+    ("GET", "videos"): ("videos.list", "videos_list"),
+    ("GET", "playlists"): ("playlists.list", "playlists_list"),
+    ("POST", "playlists"): ("playlists.insert", "playlists_insert"),
+    ("GET", "playlistItems"): ("playlistItems.list", "playlist_items_list"),
+    ("POST", "playlistItems"): ("playlistItems.insert", "playlist_items_insert"),
+}
+
+def yt_error(status: int, reason: str, message: str) -> Tuple[int, dict]:
+    return status, {"error": {"code": status, "message": message,
+                              "errors": [{"reason": reason, "domain": "youtube", "message": message}]}}
+
+class FakeApis:
+    """Routing, fault injection and quota enforcement on top of a synthetic World."""
+
+    def __init__(self, world: World, quota: Optional[int], error_rate: float, rate_limit_rate: float,
+                 jitter: float, seed: int):
+        self.world = world
+        self.quota = quota
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.jitter = jitter
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.faults = {"5xx": 0, "rate_limited": 0, "quota_exceeded": 0}
+
+    def _roll(self) -> float:
+        with self._lock:
+            return self._rnd.random()
+
+    def _fault(self, spotify: bool) -> Optional[Tuple[int, dict, dict]]:
+        if self.jitter:
+            time.sleep(self._roll() * self.jitter)
+        r = self._roll()
+        if r < self.error_rate:
+            self.faults["5xx"] += 1
+            if spotify:
+                return 503, {"error": {"status": 503, "message": "Service unavailable"}}, {}
+            status, body = yt_error(503, "backendError", "Backend Error")
+            return status, body, {}
+        if r < self.error_rate + self.rate_limit_rate:
+            self.faults["rate_limited"] += 1
+            if spotify:
+                return 429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, {"Retry-After": "1"}
+            status, body = yt_error(403, "rateLimitExceeded", "The request rate is too high")
+            return status, body, {}
+        return None
+
+    def spotify(self, method: str, path: list, query: dict, base: str) -> Tuple[int, dict, dict]:
+        # path: ["v1", "playlists", <id>] or ["v1", "playlists", <id>, "tracks"]
+        if method != "GET" or len(path) < 3 or path[1] != "playlists":
+            return 404, {"error": {"status": 404, "message": "Not found"}}, {}
+        fault = self._fault(spotify=True)
+        if fault:
+            return fault
+        pid = path[2]
+        if len(path) == 3:
+            return 200, self.world.spotify_playlist(), {}
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", 100)), 100)
+        page = self.world.spotify_playlist_items(offset=offset, limit=limit)
+        if page["next"]:
+            page["next"] = f"{base}/v1/playlists/{pid}/tracks?offset={offset + limit}&limit={limit}"
+        return 200, page, {}
+
+    def youtube(self, method: str, resource: str, query: dict, body: Optional[dict]) -> Tuple[int, dict, dict]:
+        route = YT_ROUTES.get((method, resource))
+        if not route:
+            status, err = yt_error(404, "notFound", f"{method} {resource} is not served by the fake")
+            return status, err, {}
+        name, handler = route
+        if self.quota is not None:
+            with self._lock:
+                if self.world.units + QUOTA_COSTS.get(name, 0) > self.quota:
+                    self.faults["quota_exceeded"] += 1
+                    status, err = yt_error(403, "quotaExceeded", "The request cannot be completed because you "
+                                                                 "have exceeded your quota.")
+                    return status, err, {}
+        fault = self._fault(spotify=False)
+        if fault:
+            return fault
+        kwargs = dict(query)
+        for k in ("maxResults",):
+            if k in kwargs:
+                kwargs[k] = int(kwargs[k])
+        if body is not None:
+            kwargs["body"] = body
+        return 200, getattr(self.world, handler)(**kwargs), {}
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.world.calls), "quota_units": self.world.units, "faults": dict(self.faults)}
+
+def make_handler(apis: FakeApis):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes; don't stall on delayed ACKs
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, payload: dict, headers: dict) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, method: str) -> None:
+            u = urlparse(self.path)
+            path = [p for p in u.path.split("/") if p]
+            query = {k: v[-1] for k, v in parse_qs(u.query).items()}
+            body = None
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            base = f"http://{self.headers.get('Host')}"
+            if path[:1] == ["_stats"]:
+                self._send(200, apis.stats(), {})
+            elif path[:1] == ["_reset"]:
+                apis.world.reset_counters()
+                self._send(200, {}, {})
+            elif path[:1] == ["v1"]:
+                self._send(*apis.spotify(method, path, query, base))
+            elif path[:2] == ["youtube", "v3"] and len(path) == 3:
+                self._send(*apis.youtube(method, path[2], query, body))
+            else:
+                self._send(404, {"error": {"code": 404, "message": "Not found"}}, {})
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+    return Handler
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stand-in for the Spotify and YouTube Data APIs")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--tracks", type=int, default=1000, help="Size of the synthetic playlist")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per request")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random latency per request, up to this much")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 503")
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0,
+                    help="Fraction of requests answered with 429 (Spotify) or rateLimitExceeded (YouTube)")
+    ap.add_argument("--quota", type=int, help="YouTube quota units to allow before answering quotaExceeded")
+    args = ap.parse_args()
+
+    world = World(args.tracks, seed=args.seed, latency=args.latency_ms / 1000)
+    apis = FakeApis(world, args.quota, args.error_rate, args.rate_limit_rate, args.jitter_ms / 1000, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(apis))
+    server.daemon_threads = True
+    base = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Serving {args.tracks} synthetic tracks on {base}")
+    print(f"  --spotify-api-base {base}/v1/ --yt-api-endpoint {base}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(apis.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic Spotify playlist + YouTube catalogue, with in-process stand-ins for
+the spotipy client and the googleapiclient YouTube service that spotty_tube.py talks to.
+
+Every track has a handful of YouTube uploads (the Topic "art track", a music video, a lyrics
+video, a live version); searches return them mixed with unrelated noise. The Topic upload is
+the ground truth a good resolver should pick. Channel searches and channel uploads playlists
+("UU" + channel ID) are served too, as are the auto-generated album playlists ("OLAK5uy_" IDs) that
+playlist searches find. A search for just an artist's name pages through all of that artist's
+uploads, mixed with noise. Calls, quota units and optional latency are
+accounted per endpoint.
+"""
+
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+QUOTA_COSTS = {
+    "search.list": 100,
+    "videos.list": 1,
+    "channels.list": 1,
+    "playlists.list": 1,
+    "playlists.insert": 50,
+    "playlistItems.list": 1,
+    "playlistItems.insert": 50,
+}
+
+WORDS = ["love", "night", "city", "heart", "fire", "blue", "dream", "road", "home", "light", "rain", "gold",
+         "river", "shadow", "summer", "echo", "stone", "wild", "silver", "ocean", "ghost", "morning", "paper",
+         "electric", "golden", "lonely", "midnight", "velvet", "broken", "neon"]
+SUFFIXES = ["", "", "", "", " - 2011 Remaster", " - Remastered", " (feat. {other})", " - Live", " - Radio Edit",
+            " [Deluxe Edition]", " - Mono Version"]
+
+# (kind, id prefix, duration offset, title pattern, channel pattern); art tracks carry the full release title
+UPLOADS = [
+    ("topic", "t", 0, "{name}", "{artist} - Topic"),
+    ("video", "m", 23, "{artist} - {title} (Official Video)", "{artist}VEVO"),
+    ("lyrics", "l", 2, "{artist} - {title} (Lyrics)", "Lyric Hub"),
+    ("live", "x", 41, "{artist} - {title} (Live at the Arena)", "Concert Archive"),
+]
+
+def tokens(s: str) -> frozenset:
+    return frozenset(re.findall(r"[a-z0-9]+", s.lower()))
+
+def channel_id(channel: str) -> str:
+    return f"UC{zlib.crc32(channel.encode('utf-8')):022d}"
+
+def duration_bucket(secs: int) -> str:
+    """search.list videoDuration: short (< 4 min), medium (4-20 min) or long."""
+    return "short" if secs < 240 else "medium" if secs <= 1200 else "long"
+
+def iso_duration(secs: int) -> str:
+    h, rem = divmod(secs, 3600)
+    m, s = divmod(rem, 60)
+    return "PT" + (f"{h}H" if h else "") + (f"{m}M" if m else "") + f"{s}S"
+
+class World:
+    """The synthetic catalogue plus request accounting, shared by all fake clients."""
+
+    def __init__(self, n_tracks: int, seed: int = 1, latency: float = 0.0, miss_rate: float = 0.03):
+        rnd = random.Random(seed)
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.units = 0
+        self._lock = threading.Lock()
+
+        n_artists = max(5, n_tracks // 8)
+        self.artists = [
+            " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(1, 3))) + f" {i}"
+            for i in range(n_artists)
+        ]
+        self.tracks: List[dict] = []
+        self.videos: Dict[str, dict] = {}
+        self.truth: List[Optional[str]] = []
+        self._by_tokens: Dict[frozenset, List[int]] = {}
+        self._by_title: Dict[frozenset, List[int]] = {}
+        self.channels: Dict[str, str] = {}  # channel ID → name
+        self.uploads: Dict[str, List[str]] = {}  # channel ID → video IDs
+        self._channel_by_tokens: Dict[frozenset, str] = {}
+        self.album_playlists: Dict[str, dict] = {}  # OLAK5uy_ ID → title, channel, video IDs
+        self._album_by_tokens: Dict[frozenset, str] = {}
+        self._artist_videos: Dict[frozenset, List[str]] = {}
+        album_names: Dict[Tuple[str, int], str] = {}
+        per_artist: Counter = Counter()
+        for i in range(n_tracks):
+            # Zipf-ish: a few artists own many tracks
+            artist = self.artists[min(int(rnd.paretovariate(1.2)) - 1, n_artists - 1) if rnd.random() < 0.6
+                                  else rnd.randrange(n_artists)]
+            title = " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(1, 4)))
+            name = title + rnd.choice(SUFFIXES).format(other=rnd.choice(self.artists))
+            artists = [artist] + ([rnd.choice(self.artists)] if rnd.random() < 0.1 else [])
+            secs = rnd.randint(120, 420)
+            # Albums of up to 10 tracks per artist; the name is still drawn every time to keep the catalogue stable
+            word = rnd.choice(WORDS).title()
+            album = album_names.setdefault((artist, per_artist[artist] // 10), f"{word} {artist.split()[-1]}")
+            per_artist[artist] += 1
+            self.tracks.append({
+                "name": name, "artists": [{"name": a} for a in artists], "duration_ms": secs * 1000 + rnd.randrange(1000),
+                "is_local": rnd.random() < 0.01, "album": {"name": album},
+            })
+            available = rnd.random() >= miss_rate
+            self.truth.append(f"t{i:010d}" if available else None)
+            if not available:
+                continue
+            for kind, prefix, offset, title_pat, channel_pat in UPLOADS:
+                vid = f"{prefix}{i:010d}"
+                channel = channel_pat.format(artist=artist)
+                cid = channel_id(channel)
+                self.videos[vid] = {
+                    "id": vid, "kind": kind, "duration": secs + offset,
+                    "title": title_pat.format(artist=artist, title=title, name=name), "channel": channel,
+                    "channel_id": cid,
+                }
+                self.channels[cid] = channel
+                self.uploads.setdefault(cid, []).append(vid)
+                self._channel_by_tokens.setdefault(tokens(channel), cid)
+                self._artist_videos.setdefault(tokens(artist), []).append(vid)
+            album_key = f"{artist}\t{album}"
+            apid = f"OLAK5uy_{zlib.crc32(album_key.encode('utf-8')):033d}"
+            self.album_playlists.setdefault(
+                apid, {"title": f"Album - {album}", "channel": f"{artist} - Topic", "items": []}
+            )["items"].append(f"t{i:010d}")
+            self._album_by_tokens.setdefault(tokens(f"{artist} {album}"), apid)
+            self._by_tokens.setdefault(tokens(f"{artist} {title}"), []).append(i)
+            self._by_title.setdefault(tokens(title), []).append(i)
+        self._noise = list(self.videos)
+        self.playlists: Dict[str, dict] = {}
+
+    # ---- accounting ----
+
+    def charge(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] += 1
+            self.units += QUOTA_COSTS.get(method, 0)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.units = 0
+
+    # ---- Spotify ----
+
+    def spotify_playlist_items(self, offset: int = 0, limit: int = 100) -> dict:
+        self.charge("spotify.playlist_items")
+        items = [{"track": t} for t in self.tracks[offset:offset + limit]]
+        more = offset + limit < len(self.tracks)
+        return {"items": items, "total": len(self.tracks), "offset": offset, "limit": limit,
+                "next": f"offset={offset + limit}" if more else None}
+
+    def spotify_playlist(self) -> dict:
+        self.charge("spotify.playlist")
+        return {"snapshot_id": f"snap-{len(self.tracks)}"}
+
+    # ---- YouTube ----
+
+    def _match(self, q: str) -> List[int]:
+        """Tracks the query names: same artist and title (several when an artist reuses a title)."""
+        qt = tokens(q)
+        if qt in self._by_tokens:
+            return self._by_tokens[qt]
+        found = self._by_title.get(qt, []) or [j for t, ids in self._by_title.items() if t <= qt for j in ids]
+        return [i for i in found if tokens(self.tracks[i]["artists"][0]["name"]) <= qt][:2]
+
+    def search(self, q: str, maxResults: int = 5, type: str = "video", pageToken: Optional[str] = None,
+               videoDuration: Optional[str] = None, **_) -> dict:
+        self.charge("search.list")
+        rnd = random.Random(q)
+        if type == "video" and tokens(q) in self._artist_videos:
+            ids = list(self._artist_videos[tokens(q)])
+            rnd.shuffle(ids)
+            for k in range(len(ids) // 4):  # one unrelated result in five
+                ids.insert(5 * k + 4, rnd.choice(self._noise))
+            start = int(pageToken or 0)
+            res = {"items": [{"id": {"kind": "youtube#video", "videoId": v},
+                              "snippet": {"title": self.videos[v]["title"], "channelTitle": self.videos[v]["channel"],
+                                          "channelId": self.videos[v]["channel_id"]}}
+                             for v in ids[start:start + maxResults]]}
+            if start + maxResults < len(ids):
+                res["nextPageToken"] = str(start + maxResults)
+            return res
+        if type == "channel":
+            cid = self._channel_by_tokens.get(tokens(q))
+            ids = ([cid] if cid else []) + rnd.sample(list(self.channels), min(maxResults, len(self.channels)))
+            ids = list(dict.fromkeys(ids))[:maxResults]
+            return {"items": [{"id": {"kind": "youtube#channel", "channelId": c},
+                               "snippet": {"title": self.channels[c], "channelId": c, "channelTitle": self.channels[c]}}
+                              for c in ids]}
+        if type == "playlist":
+            pid = self._album_by_tokens.get(tokens(q))
+            ids = ([pid] if pid else []) + rnd.sample(list(self.album_playlists),
+                                                      min(maxResults, len(self.album_playlists)))
+            ids = list(dict.fromkeys(ids))[:maxResults]
+            return {"items": [{"id": {"kind": "youtube#playlist", "playlistId": p},
+                               "snippet": {"title": self.album_playlists[p]["title"],
+                                           "channelTitle": self.album_playlists[p]["channel"]}}
+                              for p in ids]}
+        ids = [f"{p}{i:010d}" for i in self._match(q) for _, p, *_ in UPLOADS if f"{p}{i:010d}" in self.videos]
+        rnd.shuffle(ids)
+        noise = self._noise
+        if videoDuration:
+            ids = [v for v in ids if duration_bucket(self.videos[v]["duration"]) == videoDuration]
+            noise = [v for v in noise if duration_bucket(self.videos[v]["duration"]) == videoDuration]
+        for _ in range(maxResults - len(ids)):
+            if noise:
+                ids.append(rnd.choice(noise))
+        ids = list(dict.fromkeys(ids))[:maxResults]
+        return {"items": [{"id": {"kind": "youtube#video", "videoId": v},
+                           "snippet": {"title": self.videos[v]["title"], "channelTitle": self.videos[v]["channel"],
+                                       "channelId": self.videos[v]["channel_id"]}}
+                          for v in ids]}
+
+    def videos_list(self, id: str, **_) -> dict:
+        self.charge("videos.list")
+        items = []
+        for vid in id.split(","):
+            v = self.videos.get(vid)
+            if v:
+                items.append({"id": vid, "contentDetails": {"duration": iso_duration(v["duration"])},
+                              "snippet": {"title": v["title"], "channelTitle": v["channel"]}})
+        return {"items": items}
+
+    def playlists_list(self, pageToken: Optional[str] = None, maxResults: int = 50, **_) -> dict:
+        self.charge("playlists.list")
+        with self._lock:
+            pls = list(self.playlists.values())
+        start = int(pageToken or 0)
+        res = {"items": [{"id": p["id"], "snippet": {"title": p["title"]}} for p in pls[start:start + maxResults]]}
+        if start + maxResults < len(pls):
+            res["nextPageToken"] = str(start + maxResults)
+        return res
+
+    def playlists_insert(self, body: dict, **_) -> dict:
+        self.charge("playlists.insert")
+        with self._lock:
+            pid = f"PL{len(self.playlists):08d}"
+            self.playlists[pid] = {"id": pid, "title": body["snippet"]["title"], "items": []}
+        return {"id": pid}
+
+    def playlist_items_list(self, playlistId: str, pageToken: Optional[str] = None, maxResults: int = 50, **_) -> dict:
+        self.charge("playlistItems.list")
+        if playlistId.startswith("UU"):  # a channel's uploads
+            items = self.uploads.get("UC" + playlistId[2:], [])
+        elif playlistId.startswith("OLAK5uy_"):
+            items = self.album_playlists.get(playlistId, {}).get("items", [])
+        else:
+            with self._lock:
+                items = list(self.playlists.get(playlistId, {}).get("items", []))
+        start = int(pageToken or 0)
+        res = {"items": [{"contentDetails": {"videoId": v},
+                          "snippet": {"title": self.videos[v]["title"] if v in self.videos else "",
+                                      "resourceId": {"kind": "youtube#video", "videoId": v}}}
+                         for v in items[start:start + maxResults]]}
+        if start + maxResults < len(items):
+            res["nextPageToken"] = str(start + maxResults)
+        return res
+
+    def playlist_items_insert(self, body: dict, **_) -> dict:
+        self.charge("playlistItems.insert")
+        snip = body["snippet"]
+        with self._lock:
+            self.playlists[snip["playlistId"]]["items"].append(snip["resourceId"]["videoId"])
+        return {"id": f"item-{snip['resourceId']['videoId']}"}
+
+# ---- in-process clients ----
+
+class FakeRequest:
+    def __init__(self, fn, kwargs: dict):
+        self._fn = fn
+        self._kwargs = kwargs
+
+    def execute(self, http=None, num_retries: int = 0):
+        return self._fn(**self._kwargs)
+
+class _Resource:
+    def __init__(self, methods: Dict[str, object]):
+        self._methods = methods
+
+    def __getattr__(self, name):
+        fn = self._methods.get(name)
+        if fn is None:
+            raise AttributeError(name)
+        return lambda **kw: FakeRequest(fn, kw)
+
+class FakeYouTube:
+    """Quacks like googleapiclient's youtube v3 service for the calls spotty_tube.py makes."""
+
+    def __init__(self, world: World):
+        self.world = world
+
+    def search(self):
+        return _Resource({"list": self.world.search})
+
+    def videos(self):
+        return _Resource({"list": self.world.videos_list})
+
+    def playlists(self):
+        return _Resource({"list": self.world.playlists_list, "insert": self.world.playlists_insert})
+
+    def playlistItems(self):
+        return _Resource({"list": self.world.playlist_items_list, "insert": self.world.playlist_items_insert})
+
+class FakeSpotify:
+    """Quacks like spotipy.Spotify for playlist(), playlist_items() and next()."""
+
+    def __init__(self, world: World):
+        self.world = world
+
+    def playlist(self, playlist_id, fields=None, **_):
+        return self.world.spotify_playlist()
+
+    def playlist_items(self, playlist_id, fields=None, limit: int = 100, offset: int = 0, **_):
+        return self.world.spotify_playlist_items(offset=offset, limit=limit)
+
+    def next(self, result):
+        if not result.get("next"):
+            return None
+        return self.world.spotify_playlist_items(offset=result["offset"] + result["limit"], limit=result["limit"])
+
+def ground_truth(world: World) -> Dict[Tuple[str, str, int], Optional[str]]:
+    """Map what spotty_tube extracts for each track to the video a perfect resolver would pick."""
+    import spotty_tube
+    truth = {}
+    for t, vid in zip(world.tracks, world.truth):
+        if t["is_local"]:
+            continue
+        artists = ", ".join(a["name"] for a in t["artists"])
+        key = (spotty_tube.clean_tag(artists), spotty_tube.clean_tag(t["name"]), t["duration_ms"] // 1000)
+        truth.setdefault(key, vid)
+    return truth
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from typing import Iterable, List, Optional, Set
+
+OUTTMPL = "%(title)s [%(id)s].%(ext)s"
+VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/)([A-Za-z0-9_-]{11})")
+
+def video_id_from_url(url: str) -> Optional[str]:
+    m = VIDEO_ID_RE.search(url)
+    return m.group(1) if m else None
+
+def read_urls(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+
+def archived_ids(archive: str) -> Set[str]:
+    """Video IDs in a yt-dlp --download-archive file ("youtube <id>" per line)."""
+    ids = set()
+    if os.path.exists(archive):
+        with open(archive, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[0] == "youtube":
+                    ids.add(parts[1])
+    return ids
+
+class _LogFile:
+    """yt-dlp logger writing everything to one log file, shared by all workers."""
+
+    def __init__(self, path: str):
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _write(self, msg: str) -> None:
+        with self._lock:
+            self._f.write(msg + "\n")
+            self._f.flush()
+
+    debug = info = warning = error = _write
+
+    def close(self) -> None:
+        self._f.close()
+
+def ydl_options(outdir: str, archive: str, logger) -> dict:
+    # Same behaviour as the old yt-dlp command line: mp3 with metadata and thumbnail
+    return {
+        "format": "bestaudio/best",
+        "paths": {"home": outdir},
+        "outtmpl": OUTTMPL,
+        "download_archive": archive,
+        "continuedl": True,
+        "overwrites": False,
+        "no_warnings": True,
+        "quiet": True,
+        "noprogress": True,
+        "logger": logger,
+        "writethumbnail": True,
+        "postprocessors": [
+            {"key": "FFmpegExtractAudio", "preferredcodec": "mp3"},
+            {"key": "FFmpegMetadata", "add_metadata": True},
+            {"key": "EmbedThumbnail", "already_have_thumbnail": False},
+        ],
+    }
+
+class DownloadPool:
+    """
+    Downloads URLs with yt-dlp as a library: `workers` threads, each reusing one YoutubeDL
+    instance, fed through a bounded queue. Every URL gets a line in the JSON-lines manifest.
+    """
+
+    def __init__(self, outdir: str, workers: int = 4, manifest: Optional[str] = None, queue_size: int = 0):
+        import yt_dlp  # only needed once something is downloaded
+
+        self._yt_dlp = yt_dlp
+        self.outdir = outdir
+        os.makedirs(outdir, exist_ok=True)
+        self.archive = os.path.join(outdir, ".downloaded.txt")
+        self.done_ids = archived_ids(self.archive)
+        self.counts = {"ok": 0, "failed": 0, "skipped": 0}
+        self._log = _LogFile(os.path.join(outdir, "download.log"))
+        self._manifest = open(manifest or os.path.join(outdir, "manifest.jsonl"), "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._queued: Set[str] = set()
+        self._q: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size or workers * 4)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"download-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _record(self, url: str, vid: Optional[str], status: str, seconds: float = 0.0, error: str = "") -> None:
+        rec = {"url": url, "video_id": vid, "status": status, "seconds": round(seconds, 2),
+               "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if error:
+            rec["error"] = error
+        with self._lock:
+            self.counts[status] += 1
+            self._manifest.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._manifest.flush()
+
+    def submit(self, url: str) -> bool:
+        """Queue url unless it is already downloaded or queued; blocks while the queue is full."""
+        vid = video_id_from_url(url)
+        with self._lock:
+            if vid and (vid in self.done_ids or vid in self._queued):
+                skip = True
+            else:
+                skip = False
+                if vid:
+                    self._queued.add(vid)
+        if skip:
+            self._record(url, vid, "skipped")
+            return False
+        self._q.put(url)
+        return True
+
+    def _worker(self) -> None:
+        ydl = self._yt_dlp.YoutubeDL(ydl_options(self.outdir, self.archive, self._log))
+        while True:
+            url = self._q.get()
+            if url is None:
+                return
+            vid = video_id_from_url(url)
+            t0 = time.perf_counter()
+            print(f"Downloading: {url}")
+            try:
+                ydl.download([url])
+                self._record(url, vid, "ok", time.perf_counter() - t0)
+                if vid:
+                    with self._lock:
+                        self.done_ids.add(vid)
+            except Exception as e:  # DownloadError, postprocessing errors, ...
+                print(f"Failed: {url} (see {os.path.join(self.outdir, 'download.log')})", file=sys.stderr)
+                self._record(url, vid, "failed", time.perf_counter() - t0, str(e))
+
+    def close(self, cancel: bool = False) -> None:
+        """Wait for everything queued (or with cancel, only the downloads running), then stop the workers."""
+        if cancel:
+            while True:
+                try:
+                    url = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if url is not None:
+                    with self._lock:
+                        self._queued.discard(video_id_from_url(url))
+        for _ in self._threads:
+            self._q.put(None)
+        for t in self._threads:
+            t.join()
+        self._manifest.close()
+        self._log.close()
+
+def download_urls(urls: Iterable[str], outdir: str, workers: int = 4, manifest: Optional[str] = None) -> dict:
+    pool = DownloadPool(outdir, workers=workers, manifest=manifest)
+    try:
+        for url in urls:
+            pool.submit(url)
+    finally:
+        pool.close()
+    return pool.counts
+
+def check_tools() -> Optional[str]:
+    try:
+        import yt_dlp  # noqa: F401
+    except ImportError:
+        return "yt-dlp not found. Install it (e.g., 'pip install yt-dlp')."
+    if not shutil.which("ffmpeg"):
+        return "ffmpeg not found. Install it (e.g., 'brew install ffmpeg' or 'apt install ffmpeg')."
+    return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Download YouTube URLs as mp3 with yt-dlp, several at a time")
+    ap.add_argument("urls_file", help="File with one URL per line (# comments allowed)")
+    ap.add_argument("output_dir", nargs="?", default="downloads")
+    ap.add_argument("--workers", type=int, default=4, help="Parallel downloads")
+    ap.add_argument("--manifest", help="JSON-lines result per URL (default: <output_dir>/manifest.jsonl)")
+    args = ap.parse_args()
+
+    problem = check_tools()
+    if problem:
+        print(problem, file=sys.stderr)
+        sys.exit(2)
+
+    urls = read_urls(args.urls_file)
+    done = archived_ids(os.path.join(args.output_dir, ".downloaded.txt"))
+    todo = [u for u in urls if video_id_from_url(u) not in done]
+    print(f"Starting downloads into: {args.output_dir}")
+    print(f"Logging to: {os.path.join(args.output_dir, 'download.log')}")
+    print(f"{len(urls) - len(todo)} of {len(urls)} URLs already downloaded")
+
+    counts = download_urls(todo, args.output_dir, workers=args.workers, manifest=args.manifest)
+    print(f"Done. ok={counts['ok']}, failed={counts['failed']}, skipped={counts['skipped']}")
+
+if __name__ == "__main__":
+    main()